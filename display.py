@@ -0,0 +1,41 @@
+"""
+Display class is a thin wrapper around the luma.oled SH1106 driver.
+instead of pushing the whole 1 KB frame over I2C on every refresh, it keeps a copy of the last
+frame sent to the display and only writes the pages (8 pixel high rows) that actually changed.
+frames can be given as a PIL image like any luma device, or directly as a numpy pixel array.
+"""
+
+from luma.oled.device import sh1106
+import numpy as np
+
+class Display(sh1106):
+    def __init__(self, serial_interface=None, width=128, height=64, **kwargs):
+        # nothing has been sent yet, so the first frame (the clear on init) writes every page
+        self.prev_pages = None
+        super().__init__(serial_interface, width=width, height=height, **kwargs)
+
+    def to_pages(self, frame):
+        # pack every 8 rows into one byte per column, lsb is the top row of the page
+        pixels = np.asarray(frame, dtype=np.uint8).reshape(self._pages, 8, self.width)
+        return np.packbits(pixels, axis=1, bitorder="little").reshape(self._pages, self.width)
+
+    def display(self, image):
+        assert image.mode == self.mode
+        assert image.size == self.size
+
+        self.display_frame(np.asarray(self.preprocess(image)))
+
+    def display_frame(self, frame):
+        # frame is a (height, width) array of pixels, already in the display orientation
+        pages = self.to_pages(frame)
+
+        if self.prev_pages is None:
+            dirty = range(self._pages)
+        else:
+            dirty = np.flatnonzero(np.any(pages != self.prev_pages, axis=1))
+
+        for page in dirty:
+            self.command(0xB0 | int(page), 0x02, 0x10)
+            self.data(pages[page].tolist())
+
+        self.prev_pages = pages
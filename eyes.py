@@ -7,13 +7,13 @@ this implementation is inspired by the RoboEyes library (https://github.com/Flux
 """
 
 from luma.core.interface.serial import i2c
-from luma.oled.device import sh1106
-from luma.core.render import canvas
-from threading import Thread
-from time import time, sleep
+from PIL import Image, ImageDraw
+from threading import Thread, Lock, Event
+from time import monotonic, sleep
 from enum import Enum
-from random import uniform
-from dataclasses import dataclass
+import numpy as np
+from display import Display
+from kernels import L_X, L_Y, R_X, R_Y, L_W, L_H, R_W, R_H, L_LID_L, L_LID_R, R_LID_L, R_LID_R, HAPPY, NEXT, BASE_X, BASE_Y, new_state, tick
 
 class EyesPosition(Enum):
     CENTER = 0
@@ -26,6 +26,19 @@ class EyesPosition(Enum):
     BOTTOM_LEFT = 7
     BOTTOM_RIGHT = 8
     
+# fraction of the max x and y limits for every EyesPosition, indexed by its value
+POSITION_FACTORS = (
+    (0.5, 0.5), # CENTER
+    (0.5, 0.0), # TOP
+    (0.0, 0.5), # LEFT
+    (0.5, 1.0), # BOTTOM
+    (1.0, 0.5), # RIGHT
+    (0.0, 0.0), # TOP_LEFT
+    (1.0, 0.0), # TOP_RIGHT
+    (0.0, 1.0), # BOTTOM_LEFT
+    (1.0, 1.0)  # BOTTOM_RIGHT
+)
+
 class EyesMood(Enum):
     NEUTRAL = 0
     ANGRY = 1
@@ -33,226 +46,270 @@ class EyesMood(Enum):
     HAPPY = 3
     SAD = 4
     
-@dataclass
+def state_field(field, next=False):
+    offset = NEXT if next else 0
+
+    def get(eye):
+        return eye.state[eye.index[field] + offset]
+
+    def set(eye, value):
+        eye.state[eye.index[field] + offset] = value
+
+    return property(get, set)
+
 class Eye:
-    x: float
-    y: float
-    w: float
-    h: float
-    x_next: float
-    y_next: float
-    w_next: float
-    h_next: float
-    eyelid_h_l: float
-    eyelid_h_r: float
-    eyelid_h_l_next: float
-    eyelid_h_r_next: float
-    
+    # view of one eye inside the shared state array, the position targets are worked out by the
+    # update kernel from BASE_X/BASE_Y (see Eyes.set_position), so they have no accessors here
+    __slots__ = ("state", "index")
+
+    def __init__(self, state, x, y, w, h, eyelid_h_l, eyelid_h_r):
+        self.state = state
+        self.index = (x, y, w, h, eyelid_h_l, eyelid_h_r)
+
+    x = state_field(0)
+    y = state_field(1)
+    w = state_field(2)
+    h = state_field(3)
+    eyelid_h_l = state_field(4)
+    eyelid_h_r = state_field(5)
+    w_next = state_field(2, next=True)
+    h_next = state_field(3, next=True)
+    eyelid_h_l_next = state_field(4, next=True)
+    eyelid_h_r_next = state_field(5, next=True)
+
 class Eyes:
     def __init__(self):
         # screen setup
         self.screen_width = 128
         self.screen_height = 64
         self.frame_rate = 0.02
-        self.device = sh1106(i2c(port=1, address=0x3C), width=self.screen_width, height=self.screen_height)
+        self.idle_frame_rate = 0.2
+        self.device = Display(i2c(port=1, address=0x3C), width=self.screen_width, height=self.screen_height)
+
+        # double buffered 1-bit frames as numpy pixel arrays, the draw thread renders into
+        # the back frame while the flush thread sends the front frame to the display
+        self.frames = [np.zeros((self.screen_height, self.screen_width), dtype=bool) for _ in range(2)]
+        self.front = 0
+        self.frame_lock = Lock()
+        self.frame_ready = Event()
+        self.frame_flushed = Event()
+        self.frame_flushed.set()
         
         # default eye properties
         self.default_eye_w = 36
         self.default_eye_h = 36
         self.default_eye_radius = 8
         self.default_eye_gap = 10
+
+        # how far the left eye can move, based on the default eye size so the limits don't shrink while blinking
+        self.max_x = self.screen_width - (self.default_eye_w * 2) - self.default_eye_gap
+        self.max_y = self.screen_height - self.default_eye_h
+
+        # rounded rectangle sprites and eyelid masks, keyed by their integer size
+        self.sprites = {}
+        self.sprites_limit = 40
+        self.eyelids = {}
         
         # initialize left and right eyes
         eye_x = (self.screen_width - ((self.default_eye_w * 2) + self.default_eye_gap)) / 2
         eye_y = (self.screen_height - self.default_eye_h) / 2
 
-        self.eye_l = Eye(
-            x=eye_x,
-            y=eye_y,
-            w=self.default_eye_w,
-            h=1,
-            x_next=eye_x,
-            y_next=eye_y,
-            w_next=self.default_eye_w,
-            h_next=1,
-            eyelid_h_l=eye_y,
-            eyelid_h_r=eye_y,
-            eyelid_h_l_next=eye_y,
-            eyelid_h_r_next=eye_y
-        )
+        self.state = new_state()
+        self.eye_l = Eye(self.state, L_X, L_Y, L_W, L_H, L_LID_L, L_LID_R)
+        self.eye_r = Eye(self.state, R_X, R_Y, R_W, R_H, R_LID_L, R_LID_R)
+
+        # the eyes start closed, centered on their base position
+        self.state[BASE_X] = eye_x
+        self.state[BASE_Y] = eye_y
+        closed_y = eye_y + (self.default_eye_h - 1) / 2
+
+        for eye, x in ((self.eye_l, eye_x), (self.eye_r, eye_x + self.default_eye_w + self.default_eye_gap)):
+            eye.x = x
+            eye.y = closed_y
+            eye.w = eye.w_next = self.default_eye_w
+            eye.h = eye.h_next = 1
+            eye.eyelid_h_l = eye.eyelid_h_l_next = closed_y
+            eye.eyelid_h_r = eye.eyelid_h_r_next = closed_y
 
-        self.eye_r = Eye(
-            x=eye_x + self.default_eye_w + self.default_eye_gap,
-            y=eye_y,
-            w=self.default_eye_w,
-            h=1,
-            x_next=eye_x + self.default_eye_w + self.default_eye_gap,
-            y_next=eye_y,
-            w_next=self.default_eye_w,
-            h_next=1,
-            eyelid_h_l=eye_y,
-            eyelid_h_r=eye_y,
-            eyelid_h_l_next=eye_y,
-            eyelid_h_r_next=eye_y
-        )
-        
         # happy eyelid
-        self.eyelid_happy_h = 1
-        self.eyelid_happy_h_next = 1
+        self.state[HAPPY] = self.state[HAPPY + NEXT] = 1
         
         # state
         self.is_open = False
         self.is_idle = False
         self.mood = EyesMood.NEUTRAL
+        self.mood_id = self.mood.value
         self.idle_timer = 0
         self.blink_timer = 0
+        self.converged = False
+
+        # set by every setter, wakes the draw loop up while it's idling
+        self.changed = Event()
         
-        # start drawing thread
+        # start drawing and flushing threads
         self.thread = Thread(target=self.draw, daemon=True)
         self.thread.start()
+        self.flush_thread = Thread(target=self.flush, daemon=True)
+        self.flush_thread.start()
     
-    def interpolate(self, current, target):
-        # use averging interpolation for smooth transitions
-        return (current + target) / 2
-    
-    def get_max_x_limit(self):
-        return self.screen_width - self.eye_l.w - self.default_eye_gap - self.eye_r.w
-
-    def get_max_y_limit(self):
-        return self.screen_height - self.default_eye_h
-
     def set_idle(self, value):
         self.is_idle = value
         if not value: self.set_position(EyesPosition.CENTER)
+        self.changed.set()
 
     def set_mood(self, value):
         self.mood = value
+        self.mood_id = value.value
+        self.changed.set()
 
     def set_position(self, value):
-        max_x = self.get_max_x_limit()
-        max_y = self.get_max_y_limit()
-
-        positions = {
-            EyesPosition.CENTER: (max_x / 2, max_y / 2),
-            EyesPosition.TOP: (max_x / 2, 0),
-            EyesPosition.LEFT: (0, max_y / 2),
-            EyesPosition.BOTTOM: (max_x / 2, max_y),
-            EyesPosition.RIGHT: (max_x, max_y / 2),
-            EyesPosition.TOP_LEFT: (0, 0),
-            EyesPosition.TOP_RIGHT: (max_x, 0),
-            EyesPosition.BOTTOM_LEFT: (0, max_y),
-            EyesPosition.BOTTOM_RIGHT: (max_x, max_y)
-        }
-
-        self.eye_l.x_next, self.eye_l.y_next = positions.get(value)
+        fx, fy = POSITION_FACTORS[value.value]
+        self.state[BASE_X] = fx * self.max_x
+        self.state[BASE_Y] = fy * self.max_y
+        self.changed.set()
 
     def open(self):
         self.eye_l.h_next = self.default_eye_h
         self.eye_r.h_next = self.default_eye_h
         self.is_open = True
+        self.changed.set()
 
     def close(self):
         self.eye_l.h_next = 1
         self.eye_r.h_next = 1
         self.is_open = False
         self.set_position(EyesPosition.CENTER)
+        self.changed.set()
     
-    def update_eye_position(self):
-        # size
-        self.eye_l.w = self.interpolate(self.eye_l.w, self.eye_l.w_next)
-        self.eye_l.h = self.interpolate(self.eye_l.h, self.eye_l.h_next)
-        self.eye_r.w = self.interpolate(self.eye_r.w, self.eye_r.w_next)
-        self.eye_r.h = self.interpolate(self.eye_r.h, self.eye_r.h_next)
-
-        # centering
-        self.eye_l.x += (self.default_eye_w - self.eye_l.w) / 2
-        self.eye_l.y += (self.default_eye_h - self.eye_l.h) / 2
-        self.eye_r.x += (self.default_eye_w - self.eye_r.w) / 2
-        self.eye_r.y += (self.default_eye_h - self.eye_r.h) / 2
-
-        # position
-        self.eye_l.x = self.interpolate(self.eye_l.x, self.eye_l.x_next)
-        self.eye_l.y = self.interpolate(self.eye_l.y, self.eye_l.y_next)
-
-        # position of the right eye relative to the left eye
-        self.eye_r.x_next = self.eye_l.x_next + self.eye_l.w + self.default_eye_gap
-        self.eye_r.y_next = self.eye_l.y_next
-        self.eye_r.x = self.interpolate(self.eye_r.x, self.eye_r.x_next)
-        self.eye_r.y = self.interpolate(self.eye_r.y, self.eye_r.y_next)
-        
-    def update_eye_state(self):
-        # open eyes afterblinking
-        if self.is_open:
-            if self.eye_l.h <= 1.1: self.eye_l.h_next = self.default_eye_h
-            if self.eye_r.h <= 1.1: self.eye_r.h_next = self.default_eye_h
-
-        # blink
-        if time() >= self.blink_timer and self.is_open:
-            self.eye_l.h_next = 1
-            self.eye_r.h_next = 1
-            self.blink_timer = time() + uniform(3, 6)
-
-        # idle movement
-        if self.is_idle and self.is_open and time() >= self.idle_timer:
-            self.eye_l.x_next = uniform(0, self.get_max_x_limit())
-            self.eye_l.y_next = uniform(0, self.get_max_y_limit())
-            self.idle_timer = time() + uniform(3, 6)
-    
-    def update_eyelids(self):
-        # neutral
-        if self.mood in (EyesMood.NEUTRAL, EyesMood.HAPPY):
-            self.eye_l.eyelid_h_l_next = self.eye_l.y
-            self.eye_l.eyelid_h_r_next = self.eye_l.y
-            self.eye_r.eyelid_h_l_next = self.eye_r.y
-            self.eye_r.eyelid_h_r_next = self.eye_r.y
-
-        # angry
-        if self.mood == EyesMood.ANGRY:
-            self.eye_l.eyelid_h_l_next = self.eye_l.y + (self.eye_l.h / 4)
-            self.eye_l.eyelid_h_r_next = self.eye_l.y + (self.eye_l.h / 2)
-            self.eye_r.eyelid_h_l_next = self.eye_r.y + (self.eye_r.h / 2)
-            self.eye_r.eyelid_h_r_next = self.eye_r.y + (self.eye_r.h / 4)
-
-        # sad
-        if self.mood == EyesMood.SAD:
-            self.eye_l.eyelid_h_l_next = self.eye_l.y + (self.eye_l.h / 2)
-            self.eye_l.eyelid_h_r_next = self.eye_l.y + (self.eye_l.h / 4)
-            self.eye_r.eyelid_h_l_next = self.eye_r.y + (self.eye_r.h / 4)
-            self.eye_r.eyelid_h_r_next = self.eye_r.y + (self.eye_r.h / 2)
-
-        # tired
-        if self.mood == EyesMood.TIRED:
-            self.eye_l.eyelid_h_l_next = self.eye_l.y + (self.eye_l.h / 1.2)
-            self.eye_l.eyelid_h_r_next = self.eye_l.y + (self.eye_l.h / 1.4)
-            self.eye_r.eyelid_h_l_next = self.eye_r.y + (self.eye_r.h / 1.4)
-            self.eye_r.eyelid_h_r_next = self.eye_r.y + (self.eye_r.h / 1.2)
-
-        # happy
-        self.eyelid_happy_h_next = 3 if self.mood == EyesMood.HAPPY else 1
-        self.eyelid_happy_h = self.interpolate(self.eyelid_happy_h, self.eyelid_happy_h_next)
-
-        self.eye_l.eyelid_h_l = self.interpolate(self.eye_l.eyelid_h_l, self.eye_l.eyelid_h_l_next)
-        self.eye_l.eyelid_h_r = self.interpolate(self.eye_l.eyelid_h_r, self.eye_l.eyelid_h_r_next)
-        self.eye_r.eyelid_h_l = self.interpolate(self.eye_r.eyelid_h_l, self.eye_r.eyelid_h_l_next)
-        self.eye_r.eyelid_h_r = self.interpolate(self.eye_r.eyelid_h_r, self.eye_r.eyelid_h_r_next)
+    def get_sprite(self, w, h):
+        # rounded rectangles are rasterized with PIL once per integer size and reused as pixel masks
+        sprite = self.sprites.get((w, h))
+
+        if sprite is None:
+            if len(self.sprites) >= self.sprites_limit: self.sprites.pop(next(iter(self.sprites)))
+            image = Image.new("1", (w + 1, h + 1), 0)
+            ImageDraw.Draw(image).rounded_rectangle((0, 0, w, h), radius=self.default_eye_radius, fill=1)
+            sprite = np.asarray(image, dtype=bool)
+            self.sprites[(w, h)] = sprite
+
+        return sprite
+
+    def fill_mask(self, frame, x, y, mask, fill):
+        # clip the mask to the screen, then set or clear the pixels it covers
+        h, w = mask.shape
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, self.screen_width), min(y + h, self.screen_height)
+        if x0 >= x1 or y0 >= y1: return
+
+        region = frame[y0:y1, x0:x1]
+        mask = mask[y0 - y:y1 - y, x0 - x:x1 - x]
+        if fill: region |= mask
+        else: region &= ~mask
+
+    def fill_rounded_rectangle(self, frame, x, y, w, h, fill):
+        self.fill_mask(frame, x, y, self.get_sprite(w, h), fill)
+
+    def get_eyelid(self, w, l, r):
+        # eyelid polygons are rasterized with PIL too, once per width and eyelid heights relative to y
+        eyelid = self.eyelids.get((w, l, r))
+
+        if eyelid is None:
+            if len(self.eyelids) >= self.sprites_limit: self.eyelids.pop(next(iter(self.eyelids)))
+            top = min(0, l + 1, r + 1)
+            image = Image.new("1", (w + 5, max(0, l + 1, r + 1) - top + 1), 0)
+            ImageDraw.Draw(image).polygon(((0, -top), (w + 4, -top), (w + 4, r + 1 - top), (0, l + 1 - top)), fill=1)
+            eyelid = (top, np.asarray(image, dtype=bool))
+            self.eyelids[(w, l, r)] = eyelid
+
+        return eyelid
+
+    def clear_eyelid(self, frame, x, y, w, eyelid_h_l, eyelid_h_r):
+        # black out everything from just above the eye down to the line between both eyelid heights
+        top, mask = self.get_eyelid(w, eyelid_h_l - y, eyelid_h_r - y)
+        self.fill_mask(frame, x - 2, y - 2 + top, mask, fill=False)
+
+    def get_idle_delay(self, now):
+        # how long the draw loop can wait when nothing is animating, 0 while anything still moves
+        if not self.converged: return 0
+
+        delay = self.idle_frame_rate
+        if self.is_open: delay = min(delay, self.blink_timer - now)
+        if self.is_open and self.is_idle: delay = min(delay, self.idle_timer - now)
+        return delay
+
+    def update(self, now):
+        self.blink_timer, self.idle_timer, self.converged = tick(
+            self.state, self.max_x, self.max_y,
+            self.default_eye_w, self.default_eye_h, self.default_eye_gap,
+            self.mood_id, self.is_open, self.is_idle,
+            now, self.blink_timer, self.idle_timer
+        )
     
+    def render(self):
+        back = 1 - self.front
+        frame = self.frames[back]
+        frame.fill(False)
+
+        # quantize the eye state to whole pixels once, everything below is drawn with ints
+        lx, ly, rx, ry, lw, lh, rw, rh, l_lid_l, l_lid_r, r_lid_l, r_lid_r = np.rint(self.state[:HAPPY]).astype(np.int16).tolist()
+        l_happy_h = round(lh / self.state[HAPPY])
+        r_happy_h = round(rh / self.state[HAPPY])
+
+        # draw eyes
+        self.fill_rounded_rectangle(frame, lx, ly, lw, lh, fill=True)
+        self.fill_rounded_rectangle(frame, rx, ry, rw, rh, fill=True)
+
+        # draw eyelids
+        self.clear_eyelid(frame, lx, ly, lw, l_lid_l, l_lid_r)
+        self.clear_eyelid(frame, rx, ry, rw, r_lid_l, r_lid_r)
+
+        # happy eyelids
+        self.fill_rounded_rectangle(frame, lx, ly + l_happy_h + 2, lw, lh - l_happy_h, fill=False)
+        self.fill_rounded_rectangle(frame, rx, ry + r_happy_h + 2, rw, rh - r_happy_h, fill=False)
+
+        # skip the flush entirely when nothing changed since the last frame sent
+        if not np.array_equal(frame, self.frames[self.front]):
+            # wait until the display is done with the front frame, then swap
+            self.frame_flushed.wait()
+            self.frame_flushed.clear()
+            with self.frame_lock:
+                self.front = back
+            self.frame_ready.set()
+
     def draw(self):
+        next_tick = monotonic()
+
         while True:
-            self.update_eye_position()
-            self.update_eye_state()
-            self.update_eyelids()
+            # read the clock once per frame, monotonic so the timers don't jump with wall clock changes
+            now = monotonic()
+
+            # once everything has settled, nothing changes until a setter or a timer fires
+            if not self.converged or self.changed.is_set() or self.get_idle_delay(now) <= 0:
+                self.changed.clear()
+                self.update(now)
+                self.render()
 
-            with canvas(self.device) as draw:
-                # draw eyes
-                draw.rounded_rectangle(((self.eye_l.x, self.eye_l.y), (self.eye_l.x + self.eye_l.w, self.eye_l.y + self.eye_l.h)), radius=self.default_eye_radius, fill="white")
-                draw.rounded_rectangle(((self.eye_r.x, self.eye_r.y), (self.eye_r.x + self.eye_r.w, self.eye_r.y + self.eye_r.h)), radius=self.default_eye_radius, fill="white")
+            # when nothing is animating, wait for a setter or the next timer instead of the next frame
+            idle_delay = self.get_idle_delay(now)
+            if idle_delay > self.frame_rate:
+                self.changed.wait(idle_delay)
+                next_tick = monotonic()
+                continue
 
-                # draw eyelids
-                draw.polygon(((self.eye_l.x - 2, self.eye_l.y - 2), (self.eye_l.x + self.eye_l.w + 2, self.eye_l.y - 2), (self.eye_l.x + self.eye_l.w + 2, self.eye_l.eyelid_h_r - 1), (self.eye_l.x - 2, self.eye_l.eyelid_h_l - 1)), fill="black")
-                draw.polygon(((self.eye_r.x - 2, self.eye_r.y - 2), (self.eye_r.x + self.eye_r.w + 2, self.eye_r.y - 2), (self.eye_r.x + self.eye_r.w + 2, self.eye_r.eyelid_h_r - 1), (self.eye_r.x - 2, self.eye_r.eyelid_h_l - 1)), fill="black")
+            # sleep until the next frame is due instead of a fixed delay after the work,
+            # when a frame runs late start counting again from now
+            next_tick += self.frame_rate
+            delay = next_tick - monotonic()
+            if delay > 0: sleep(delay)
+            else: next_tick = monotonic()
+
+    def flush(self):
+        while True:
+            self.frame_ready.wait()
+            self.frame_ready.clear()
 
-                # happy eyelids
-                draw.rounded_rectangle(((self.eye_l.x, self.eye_l.y + (self.eye_l.h / self.eyelid_happy_h) + 2), (self.eye_l.x + self.eye_l.w, self.eye_l.y + self.eye_l.h + 2)), radius=self.default_eye_radius, fill="black")
-                draw.rounded_rectangle(((self.eye_r.x, self.eye_r.y + (self.eye_r.h / self.eyelid_happy_h) + 2), (self.eye_r.x + self.eye_r.w, self.eye_r.y + self.eye_r.h + 2)), radius=self.default_eye_radius, fill="black")
+            with self.frame_lock:
+                frame = self.frames[self.front]
 
-            sleep(self.frame_rate)
\ No newline at end of file
+            self.device.display_frame(frame)
+            self.frame_flushed.set()
\ No newline at end of file
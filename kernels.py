@@ -0,0 +1,144 @@
+"""
+update kernels for the Eyes class, kept apart from the drawing code so they can be compiled on their own.
+with numba installed they are jit compiled when the module is imported. on boards where numba (and llvmlite)
+is too heavy, this module can be compiled ahead of time with mypyc instead (`mypyc kernels.py`),
+python will then pick the compiled extension over this file. without either, they simply run as plain python.
+the kernels are written as plain scalar code on purpose, numpy calls on a handful of values are dominated
+by their call overhead, which neither mypyc nor the interpreter can remove.
+"""
+
+from random import uniform
+from types import FunctionType
+from typing import Any, Callable, Final
+import numpy as np
+
+try:
+    from numba import njit
+    has_numba = True
+except ImportError:
+    # numba is optional, without it the update kernels run as plain python
+    has_numba = False
+
+def kernel(signature: str) -> Callable[[Any], Any]:
+    # jit compile with numba when it's installed, the jitted kernels work on the state array as is.
+    # functions that are already native because this module was built with mypyc are left as they are
+    def decorate(func: Any) -> Any:
+        if not use_numba: return func
+        return njit(signature, cache=True, fastmath=True)(func)
+
+    return decorate
+
+# numba can only compile plain python functions, so a mypyc build never uses it
+use_numba = has_numba and isinstance(kernel, FunctionType)
+
+# eye state layout, the current values followed by their targets at the same index + NEXT,
+# then the base position of the eyes (top left of the default sized left eye) they're centered on
+# the indices are Final so a mypyc build inlines them instead of looking them up on every access
+L_X: Final = 0
+L_Y: Final = 1
+R_X: Final = 2
+R_Y: Final = 3
+L_W: Final = 4
+L_H: Final = 5
+R_W: Final = 6
+R_H: Final = 7
+L_LID_L: Final = 8
+L_LID_R: Final = 9
+R_LID_L: Final = 10
+R_LID_R: Final = 11
+HAPPY: Final = 12
+NEXT: Final = 13
+BASE_X: Final = NEXT * 2
+BASE_Y: Final = NEXT * 2 + 1
+STATE_SIZE: Final = NEXT * 2 + 2
+
+# eyelid heights for every EyesMood as a fraction of the eye height, indexed by its value
+# columns are left eye (left, right) and right eye (left, right)
+EYELID_FACTORS: tuple[tuple[float, float, float, float], ...] = (
+    (0.0, 0.0, 0.0, 0.0),                   # NEUTRAL
+    (1 / 4, 1 / 2, 1 / 2, 1 / 4),           # ANGRY
+    (1 / 1.2, 1 / 1.4, 1 / 1.4, 1 / 1.2),   # TIRED
+    (0.0, 0.0, 0.0, 0.0),                   # HAPPY
+    (1 / 2, 1 / 4, 1 / 4, 1 / 2)            # SAD
+)
+
+# happy eyelid for every EyesMood, indexed by its value
+HAPPY_EYELID: tuple[float, ...] = (1.0, 1.0, 1.0, 3.0, 1.0)
+
+def new_state() -> Any:
+    # the state is a numpy array only for the numba kernels. mypyc and plain python index a list
+    # of floats a lot faster than numpy scalars, so everywhere else it's just a list
+    if use_numba: return np.zeros(STATE_SIZE)
+    return [0.0] * STATE_SIZE
+
+# explicit signatures make numba compile the kernels when the module is imported,
+# instead of on the first frame
+@kernel("boolean(float64[::1], int64, int64)")
+def interpolate(state: list[float], start: int, end: int) -> bool:
+    # use averging interpolation for smooth transitions, then snap values within half a pixel
+    # of their target so they settle instead of creeping forever
+    converged = True
+
+    for i in range(start, end):
+        target = state[i + NEXT]
+        current = (state[i] + target) * 0.5
+
+        if abs(current - target) < 0.5: current = target
+        else: converged = False
+
+        state[i] = current
+
+    return converged
+
+@kernel("Tuple((float64, float64, boolean))(float64[::1], int64, int64, int64, int64, int64, int64, boolean, boolean, float64, float64, float64)")
+def tick(
+    state: list[float], max_x: int, max_y: int,
+    default_w: int, default_h: int, gap: int,
+    mood: int, is_open: bool, is_idle: bool,
+    now: float, blink_timer: float, idle_timer: float
+) -> tuple[float, float, bool]:
+    # work out every target first, then move everything towards its target in one fused pass
+    # over the state array. once everything has converged another tick can't change anything
+    # until a setter or a timer fires, which is what lets the draw loop skip it
+
+    # open eyes after blinking
+    if is_open:
+        if state[L_H] <= 1.1: state[L_H + NEXT] = default_h
+        if state[R_H] <= 1.1: state[R_H + NEXT] = default_h
+
+    # blink
+    if now >= blink_timer and is_open:
+        state[L_H + NEXT] = 1
+        state[R_H + NEXT] = 1
+        blink_timer = now + uniform(3, 6)
+
+    # idle movement
+    if is_idle and is_open and now >= idle_timer:
+        state[BASE_X] = uniform(0, max_x)
+        state[BASE_Y] = uniform(0, max_y)
+        idle_timer = now + uniform(3, 6)
+
+    # position, centered on the base position by the target size so the target doesn't
+    # move while the eyes are resizing, the right eye is placed relative to the left eye
+    state[L_X + NEXT] = state[BASE_X] + (default_w - state[L_W + NEXT]) / 2
+    state[L_Y + NEXT] = state[BASE_Y] + (default_h - state[L_H + NEXT]) / 2
+    state[R_X + NEXT] = state[BASE_X] + state[L_W + NEXT] + gap + (default_w - state[R_W + NEXT]) / 2
+    state[R_Y + NEXT] = state[BASE_Y] + (default_h - state[R_H + NEXT]) / 2
+
+    # eyelids, relative to where the eyes are heading so they don't lag a frame behind
+    factors = EYELID_FACTORS[mood]
+    state[L_LID_L + NEXT] = state[L_Y + NEXT] + factors[0] * state[L_H + NEXT]
+    state[L_LID_R + NEXT] = state[L_Y + NEXT] + factors[1] * state[L_H + NEXT]
+    state[R_LID_L + NEXT] = state[R_Y + NEXT] + factors[2] * state[R_H + NEXT]
+    state[R_LID_R + NEXT] = state[R_Y + NEXT] + factors[3] * state[R_H + NEXT]
+
+    # happy
+    state[HAPPY + NEXT] = HAPPY_EYELID[mood]
+
+    converged = interpolate(state, 0, NEXT)
+
+    # open eyes that are blinking still have to reopen on a later tick, so they haven't settled
+    if is_open and (state[L_H + NEXT] != default_h or state[R_H + NEXT] != default_h):
+        converged = False
+
+    return blink_timer, idle_timer, converged
@@ -0,0 +1,59 @@
+import random
+import numpy as np
+from kernels import L_X, L_Y, R_X, R_Y, L_W, L_H, R_W, R_H, L_LID_L, L_LID_R, R_LID_L, R_LID_R, HAPPY, NEXT, BASE_X, BASE_Y, EYELID_FACTORS, new_state, tick
+
+# a timer that never fires during a test
+FAR = 1e9
+
+def make_state(x, y, h):
+    state = new_state()
+    for i, value in ((L_X, x), (L_Y, y), (R_X, x + 46), (R_Y, y), (L_W, 36), (L_H, h), (R_W, 36), (R_H, h)):
+        state[i] = state[i + NEXT] = value
+    for i in (L_LID_L, L_LID_R, R_LID_L, R_LID_R):
+        state[i] = state[i + NEXT] = y
+    state[HAPPY] = state[HAPPY + NEXT] = 1
+    move_to(state, x, y)
+    return state
+
+def move_to(state, x, y):
+    state[BASE_X] = x
+    state[BASE_Y] = y
+
+def run(state, mood, is_open, blink_timer=FAR):
+    return tick(state, 46, 28, 36, 36, 10, mood, is_open, False, 0.0, blink_timer, FAR)
+
+def test_converged_state_is_a_fixed_point():
+    # the draw loop skips tick() while converged, so another tick must not change anything
+    random.seed(0)
+
+    for _ in range(100):
+        mood = random.randrange(len(EYELID_FACTORS))
+        is_open = random.random() < 0.8
+        state = make_state(random.uniform(0, 46), random.uniform(0, 28), 1)
+        state[L_H + NEXT] = state[R_H + NEXT] = 36 if is_open else 1
+        move_to(state, random.uniform(0, 46), random.uniform(0, 28))
+
+        # blink straight away like a freshly opened Eyes, then once more halfway through
+        blink_timer = 0.0
+        for i in range(100):
+            if i == 50: blink_timer = 0.0
+            blink_timer, _, converged = run(state, mood, is_open, blink_timer)
+
+            if converged:
+                before = state.copy()
+                run(state, mood, is_open)
+                assert np.array_equal(state, before)
+
+def test_open_eyes_reopen_after_blink():
+    # settle closed like a new Eyes, then open it with its first blink already due
+    state = make_state(23, 14, 1)
+    while not run(state, 0, False)[2]: pass
+    state[L_H + NEXT] = state[R_H + NEXT] = 36
+
+    blink_timer = 0.0
+    for _ in range(50):
+        blink_timer, _, converged = run(state, 0, True, blink_timer)
+        if converged: break
+
+    assert converged
+    assert state[L_H] == state[R_H] == 36